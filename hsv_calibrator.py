@@ -37,13 +37,25 @@ cv2.createTrackbar("H High", "Trackbars", 80, 179, nothing)
 cv2.createTrackbar("S High", "Trackbars", 255, 255, nothing)
 cv2.createTrackbar("V High", "Trackbars", 255, 255, nothing)
 
+# Pre-allocated HSV bounds and work buffers (reused every frame)
+lower = np.empty(3, np.uint8)
+upper = np.empty(3, np.uint8)
+hsv_buf = None
+mask_buf = None
+prev_bounds = None
+
 # Main loop
 while True:
     ret, frame = cap.read()
     if not ret:
         break
 
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    # (Re)allocate buffers only when the frame size changes
+    if hsv_buf is None or hsv_buf.shape != frame.shape:
+        hsv_buf = np.empty(frame.shape, np.uint8)
+        mask_buf = np.empty(frame.shape[:2], np.uint8)
+
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=hsv_buf)
 
     # Read HSV thresholds from sliders
     hL = cv2.getTrackbarPos("H Low", "Trackbars")
@@ -53,17 +65,21 @@ while True:
     sH = cv2.getTrackbarPos("S High", "Trackbars")
     vH = cv2.getTrackbarPos("V High", "Trackbars")
 
-    lower = np.array([hL, sL, vL])
-    upper = np.array([hH, sH, vH])
+    # Only rewrite the bound arrays when a slider actually moved
+    bounds = (hL, sL, vL, hH, sH, vH)
+    if bounds != prev_bounds:
+        lower[:] = bounds[:3]
+        upper[:] = bounds[3:]
+        prev_bounds = bounds
 
     # Create mask and filtered result
-    mask = cv2.inRange(hsv, lower, upper)
+    mask = cv2.inRange(hsv, lower, upper, dst=mask_buf)
     result = cv2.bitwise_and(frame, frame, mask=mask)
 
-    # Resize for better layout (optional)
-    frame_small = cv2.resize(frame, (400, 300))
-    mask_small = cv2.resize(mask, (400, 300))
-    result_small = cv2.resize(result, (400, 300))
+    # Resize for better layout (preview only, so nearest-neighbor is enough)
+    frame_small = cv2.resize(frame, (400, 300), interpolation=cv2.INTER_NEAREST)
+    mask_small = cv2.resize(mask, (400, 300), interpolation=cv2.INTER_NEAREST)
+    result_small = cv2.resize(result, (400, 300), interpolation=cv2.INTER_NEAREST)
 
     # Show in organized windows
     cv2.imshow("1. Original Frame", frame_small)
@@ -6,9 +6,12 @@ You can either select from built-in color presets or load custom HSV thresholds
 
 Features:
 - Real-time object tracking based on HSV masking
+- Smooth PID velocity control via send_rc_control
 - User prompt to choose default or tuned HSV config
-- Modular detection logic
-- Command-line control: takeoff, start tracking, land, exit
+- Modular detection logic (CUDA/OpenCL-accelerated when available)
+- Keyboard control: takeoff, start/stop tracking, land, exit
+- Live video/mask display only when TELLO_DEBUG=1
+- Threaded frame capture and non-blocking key handling so tracking never blocks
 - Safe landing and resource cleanup on quit
 
 Author: Qiyue Chen
@@ -17,15 +20,25 @@ Date: 2025-06-30
 
 import cv2
 import numpy as np
+import os
 import time
 import json
+import queue
+import threading
 from djitellopy import Tello
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from utils.pid import PID
+from utils.hsv_mask import HAVE_NATIVE, HAVE_NUMBA, bgr_to_mask, bgr_to_mask_native
+
 # ---------------------------------------------
 # HSV Color Presets
 # ---------------------------------------------
 
-COLOR_PRESETS = {
+_RAW_PRESETS = {
     "green": {
         "lower": [40, 70, 70],
         "upper": [80, 255, 255]
@@ -40,6 +53,50 @@ COLOR_PRESETS = {
     }
 }
 
+# Presets pre-converted to the uint8 arrays cv2.inRange expects
+COLOR_PRESETS = {
+    name: (np.asarray(hsv["lower"], np.uint8), np.asarray(hsv["upper"], np.uint8))
+    for name, hsv in _RAW_PRESETS.items()
+}
+
+# ---------------------------------------------
+# Detection Settings
+# ---------------------------------------------
+
+DETECT_SIZE = (320, 240)  # (width, height) used for color masking
+MIN_AREA = 300            # minimum object area in full-frame pixels
+
+# Direct BGR test for the green preset (skips color conversion)
+BGR_GREEN_MARGIN = 30     # G must exceed R and B by this much
+BGR_GREEN_MIN = 60        # minimum G value
+
+# 3x3 kernel for removing speckle noise from the mask
+MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+# Reusable work buffers for the downscaled detection pipeline
+_small_buf = np.empty((DETECT_SIZE[1], DETECT_SIZE[0], 3), np.uint8)
+_hsv_buf = np.empty((DETECT_SIZE[1], DETECT_SIZE[0], 3), np.uint8)
+_mask_buf = np.empty((DETECT_SIZE[1], DETECT_SIZE[0]), np.uint8)
+_plane_bufs = [np.empty((DETECT_SIZE[1], DETECT_SIZE[0]), np.uint8) for _ in range(5)]
+
+# Live video/mask windows are only drawn when TELLO_DEBUG=1
+DEBUG = os.environ.get("TELLO_DEBUG") == "1"
+
+# Optional fused mask kernel (TELLO_MASK_KERNEL=native or numba); OpenCV's
+# cvtColor + inRange is the default as it is faster on real scenes
+MASK_KERNEL = os.environ.get("TELLO_MASK_KERNEL", "opencv")
+
+# Use OpenCV's transparent API (OpenCL) when a device is available
+USE_OPENCL = cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(USE_OPENCL)
+
+# Run the whole mask pipeline on an NVIDIA GPU when OpenCV has CUDA support
+USE_CUDA = hasattr(cv2, "cuda") and cv2.cuda.getCudaEnabledDeviceCount() > 0
+
+if USE_CUDA:
+    _gpu_frame = cv2.cuda_GpuMat()
+    _gpu_open = cv2.cuda.createMorphologyFilter(cv2.MORPH_OPEN, cv2.CV_8UC1, MORPH_KERNEL)
+
 # ---------------------------------------------
 # Load HSV Configuration
 # ---------------------------------------------
@@ -49,7 +106,8 @@ def load_hsv_config():
     Prompt user to select a color or load a custom config from hsv_config.json.
 
     Returns:
-        tuple: lower and upper HSV bounds as NumPy arrays
+        tuple: lower and upper HSV bounds as NumPy arrays, and the preset
+               name ("green", "red", "blue") or None for a custom config
     """
     print("Select tracking color:")
     print("1 - Green (default)")
@@ -59,155 +117,376 @@ def load_hsv_config():
 
     choice = input("Enter choice [1-4]: ").strip()
 
+    preset = None
     if choice == '1':
-        hsv = COLOR_PRESETS["green"]
+        preset = "green"
     elif choice == '2':
-        hsv = COLOR_PRESETS["red"]
+        preset = "red"
     elif choice == '3':
-        hsv = COLOR_PRESETS["blue"]
+        preset = "blue"
     elif choice == '4':
         try:
-            with open("hsv_config.json", "r") as f:
-                hsv = json.load(f)
+            with open("hsv_config.json", "rb") as f:
+                data = f.read()
+            hsv = orjson.loads(data) if orjson is not None else json.loads(data)
+            lower = np.asarray(hsv["lower"], np.uint8)
+            upper = np.asarray(hsv["upper"], np.uint8)
         except Exception as e:
             print("Failed to load hsv_config.json:", e)
             print("Falling back to green.")
-            hsv = COLOR_PRESETS["green"]
+            preset = "green"
     else:
         print("Invalid input. Using default green.")
-        hsv = COLOR_PRESETS["green"]
+        preset = "green"
+
+    if preset is not None:
+        lower, upper = COLOR_PRESETS[preset]
 
-    lower = np.array(hsv["lower"])
-    upper = np.array(hsv["upper"])
-    return lower, upper
+    return lower, upper, preset
 
 # ---------------------------------------------
 # Object Detection
 # ---------------------------------------------
 
-def detect_object(frame, lower, upper):
+def detect_bgr_green(frame, out_mask):
+    """
+    Threshold green pixels directly in BGR, without any color conversion.
+
+    A pixel is green when G exceeds both R and B by BGR_GREEN_MARGIN and
+    is brighter than BGR_GREEN_MIN. Uses saturating uint8 OpenCV ops, so
+    no widened copy of the frame is made.
+
+    Parameters:
+        frame (np.ndarray): Input BGR frame
+        out_mask (np.ndarray): Output uint8 mask (0 or 255), same height/width
+
+    Returns:
+        np.ndarray: out_mask
+    """
+    # Reuse the shared planes when the frame is DETECT_SIZE (the normal case)
+    if frame.shape[:2] == _plane_bufs[0].shape:
+        b, g, r, gr, gb = _plane_bufs
+    else:
+        b, g, r, gr, gb = [np.empty(frame.shape[:2], np.uint8) for _ in range(5)]
+    cv2.split(frame, [b, g, r])
+
+    # min(G - R, G - B) with negatives saturated to 0
+    cv2.subtract(g, r, dst=gr)
+    cv2.subtract(g, b, dst=gb)
+    cv2.min(gr, gb, dst=gr)
+    cv2.threshold(gr, BGR_GREEN_MARGIN, 255, cv2.THRESH_BINARY, dst=out_mask)
+
+    cv2.threshold(g, BGR_GREEN_MIN, 255, cv2.THRESH_BINARY, dst=gb)
+    return cv2.bitwise_and(out_mask, gb, dst=out_mask)
+
+def mask_area(mask):
+    """
+    Count foreground pixels of a binary mask.
+
+    Parameters:
+        mask (np.ndarray): Binary uint8 mask (0 or 255)
+
+    Returns:
+        int: Number of foreground pixels
+    """
+    return cv2.countNonZero(mask)
+
+def build_mask(frame, lower, upper, bgr_green=False):
+    """
+    Downscale the frame to DETECT_SIZE and build a denoised HSV mask.
+
+    With bgr_green set, the mask comes from detect_bgr_green instead of an
+    HSV threshold. Otherwise it runs on the CUDA device or the OpenCL device
+    (cv2.UMat) when available, or on the CPU using the shared work buffers
+    (with a fused native AVX2 or Numba kernel only when selected through
+    TELLO_MASK_KERNEL).
+
+    Parameters:
+        frame (np.ndarray): Input BGR frame
+        lower (np.ndarray): Lower HSV threshold
+        upper (np.ndarray): Upper HSV threshold
+        bgr_green (bool): Use the direct BGR green test
+
+    Returns:
+        np.ndarray: Binary mask of size DETECT_SIZE
+    """
+    if USE_CUDA and not bgr_green:
+        # Pixels stay in device memory; only the small mask is downloaded
+        _gpu_frame.upload(frame)
+        gsmall = cv2.cuda.resize(_gpu_frame, DETECT_SIZE, interpolation=cv2.INTER_AREA)
+        ghsv = cv2.cuda.cvtColor(gsmall, cv2.COLOR_BGR2HSV)
+        gmask = cv2.cuda.inRange(ghsv, tuple(map(int, lower)), tuple(map(int, upper)))
+        gmask = _gpu_open.apply(gmask)
+        return gmask.download()
+
+    if USE_OPENCL and not bgr_green:
+        uframe = cv2.UMat(frame)
+        usmall = cv2.resize(uframe, DETECT_SIZE, interpolation=cv2.INTER_AREA)
+        uhsv = cv2.cvtColor(usmall, cv2.COLOR_BGR2HSV)
+        umask = cv2.inRange(uhsv, lower, upper)
+        umask = cv2.morphologyEx(umask, cv2.MORPH_OPEN, MORPH_KERNEL)
+        return umask.get()
+
+    small = cv2.resize(frame, DETECT_SIZE, dst=_small_buf, interpolation=cv2.INTER_AREA)
+    if bgr_green:
+        mask = detect_bgr_green(small, _mask_buf)
+    elif MASK_KERNEL == "native" and HAVE_NATIVE:
+        # Fused BGR -> HSV -> threshold (AVX2), no intermediate HSV image
+        bgr_to_mask_native(small, lower, upper, _mask_buf)
+        mask = _mask_buf
+    elif MASK_KERNEL == "numba" and HAVE_NUMBA:
+        # Fused BGR -> HSV -> threshold, no intermediate HSV image
+        bgr_to_mask(small, *map(int, lower), *map(int, upper), _mask_buf)
+        mask = _mask_buf
+    else:
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV, dst=_hsv_buf)
+        mask = cv2.inRange(hsv, lower, upper, dst=_mask_buf)
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL, dst=_mask_buf)
+
+def detect_object(frame, lower, upper, bgr_green=False):
     """
     Detect the largest object matching the HSV mask in the frame.
 
+    The frame is downscaled to DETECT_SIZE before color conversion, and the
+    detected center is scaled back to full-frame coordinates.
+
     Parameters:
         frame (np.ndarray): Input BGR frame from the drone
         lower (np.ndarray): Lower HSV threshold
         upper (np.ndarray): Upper HSV threshold
+        bgr_green (bool): Use the direct BGR green test instead of HSV
 
     Returns:
-        tuple: (x, y) of object center if found, and the binary mask
+        tuple: (x, y) of object center if found, and the (downscaled) binary mask.
+               The mask may be a shared buffer overwritten by the next call.
     """
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    mask = cv2.inRange(hsv, lower, upper)
-    contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-
-    if contours:
-        c = max(contours, key=cv2.contourArea)
-        if cv2.contourArea(c) > 300:
-            x, y, w, h = cv2.boundingRect(c)
-            return (x + w // 2, y + h // 2), mask
+    frame_h, frame_w = frame.shape[:2]
+    small_w, small_h = DETECT_SIZE
+    scale_x, scale_y = frame_w / small_w, frame_h / small_h
+
+    mask = build_mask(frame, lower, upper, bgr_green)
+    min_area = MIN_AREA / (scale_x * scale_y)
+
+    # Skip component labelling when there is not enough foreground at all
+    if mask_area(mask) <= min_area:
+        return None, mask
+
+    num, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+    # Label 0 is the background; pick the largest foreground component
+    if num > 1:
+        i = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+        # Area threshold is scaled to the downscaled image
+        if stats[i, cv2.CC_STAT_AREA] > min_area:
+            cx, cy = centroids[i]
+            return (int(cx * scale_x), int(cy * scale_y)), mask
     return None, mask
 
+def show_status(flying, tracking):
+    """
+    Draw a small status panel in the 'Tello View' window.
+
+    Used instead of the live feed when DEBUG is off, so the window still
+    exists to receive key presses.
+
+    Parameters:
+        flying (bool): Whether the drone is airborne
+        tracking (bool): Whether tracking is active
+    """
+    panel = np.zeros((60, 320, 3), np.uint8)
+    text = "flying: %s  tracking: %s" % ("yes" if flying else "no", "on" if tracking else "off")
+    cv2.putText(panel, text, (10, 35), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    cv2.imshow("Tello View", panel)
+
+# ---------------------------------------------
+# Background Workers
+# ---------------------------------------------
+
+def frame_producer(tello, frame_q, stop_event):
+    """
+    Continuously grab frames from the drone and keep only the latest one.
+
+    Parameters:
+        tello (Tello): Connected Tello instance with the stream on
+        frame_q (queue.Queue): Size-1 queue holding the newest frame
+        stop_event (threading.Event): Set to stop the producer
+    """
+    # Resolve the background reader once instead of on every poll
+    frame_reader = tello.get_frame_read()
+    last_frame = None
+    while not stop_event.is_set():
+        frame = frame_reader.frame
+        # A new decoded frame is a new array, so identity detects changes
+        if frame is None or frame is last_frame:
+            time.sleep(0.005)
+            continue
+        last_frame = frame
+
+        # Drop the stale frame (if any) so the consumer always gets the newest
+        try:
+            frame_q.get_nowait()
+        except queue.Empty:
+            pass
+        frame_q.put(frame)
+
 # ---------------------------------------------
 # Main Function
 # ---------------------------------------------
 
 def main():
     # Load HSV thresholds
-    lower_hsv, upper_hsv = load_hsv_config()
+    lower_hsv, upper_hsv, preset = load_hsv_config()
+
+    # The green preset can be thresholded directly in BGR;
+    # custom configs keep the HSV path
+    bgr_green = preset == "green"
+    if bgr_green:
+        print("Green preset: using the direct BGR test "
+              "(G > R, B by %d and G > %d) instead of HSV thresholds." % (BGR_GREEN_MARGIN, BGR_GREEN_MIN))
+
+    # Compile jitted code now rather than on the first tracked frame after takeoff
+    PID(kp=0.0, ki=0.0, kd=0.0).update(0.0, 1.0)
+    if MASK_KERNEL == "numba" and HAVE_NUMBA:
+        bgr_to_mask(_small_buf, *map(int, lower_hsv), *map(int, upper_hsv), _mask_buf)
 
     # Initialize Tello
     tello = Tello()
     tello.connect()
+
+    # Request the low-resolution, high-FPS stream so frames need no resizing
+    # (requires Tello SDK 3.0; older firmware keeps the default stream)
+    try:
+        tello.set_video_resolution(Tello.RESOLUTION_480P)
+        tello.set_video_fps(Tello.FPS_30)
+    except Exception as e:
+        print("Could not set video resolution/FPS:", e)
+
     tello.streamon()
 
-    # Frame settings
-    frame_width, frame_height = 640, 480
-    center_x, center_y = frame_width // 2, frame_height // 2
-    tolerance = 40  # pixel offset tolerance
+    # PID controllers for left/right and up/down velocity
+    pid_x = PID(kp=0.25, ki=0.0, kd=0.05)
+    pid_y = PID(kp=0.25, ki=0.0, kd=0.05)
 
-    print("\n--- Tello Tracker Commands ---")
-    print("Type one of the following commands:")
-    print("[takeoff]    - Launch drone")
-    print("[start]      - Start object tracking")
-    print("[land]       - Land the drone")
-    print("[exit]       - Exit program\n")
+    # Frame capture runs in its own thread
+    frame_q = queue.Queue(maxsize=1)
+    stop_event = threading.Event()
+
+    threading.Thread(target=frame_producer, args=(tello, frame_q, stop_event), daemon=True).start()
+
+    print("\n--- Tello Tracker Keys (focus the 'Tello View' window) ---")
+    print("[t] - Launch drone")
+    print("[s] - Start / stop object tracking")
+    print("[l] - Land the drone")
+    print("[q] - Exit program\n")
 
     flying = False
     tracking = False
+    target_locked = False
+    prev_time = time.perf_counter()
+
+    if not DEBUG:
+        show_status(flying, tracking)
 
     try:
         while True:
-            # Read user input
-            cmd = input("Command > ").strip().lower()
+            # Process the newest available frame
+            try:
+                frame = frame_q.get(timeout=0.1)
+            except queue.Empty:
+                frame = None
 
-            if cmd == "takeoff":
-                if not flying:
-                    tello.takeoff()
-                    flying = True
-                    print("Drone has taken off.")
-                else:
-                    print("Drone is already flying.")
+            if frame is None and tracking:
+                # Stream stalled: stop moving rather than keep the last velocity
+                tello.send_rc_control(0, 0, 0, 0)
+                target_locked = False
 
-            elif cmd == "start":
-                if not flying:
-                    print("Please take off before starting tracking.")
-                    continue
-                print("Starting object tracking...")
-                tracking = True
+            if frame is not None:
+                # Frame center is taken from the stream itself (no resize)
+                frame_height, frame_width = frame.shape[:2]
+                center_x, center_y = frame_width // 2, frame_height // 2
 
-                # Tracking loop
-                while tracking:
-                    frame = tello.get_frame_read().frame
-                    frame = cv2.resize(frame, (frame_width, frame_height))
+                if tracking:
+                    center, mask = detect_object(frame, lower_hsv, upper_hsv, bgr_green)
 
-                    center, mask = detect_object(frame, lower_hsv, upper_hsv)
+                    now = time.perf_counter()
+                    dt = now - prev_time
+                    prev_time = now
 
                     if center:
-                        cv2.circle(frame, center, 10, (0, 255, 0), -1)
+                        if DEBUG:
+                            cv2.circle(frame, center, 10, (0, 255, 0), -1)
 
                         offset_x = center[0] - center_x
                         offset_y = center_y - center[1]
 
-                        if offset_x < -tolerance:
-                            tello.move_left(20)
-                        elif offset_x > tolerance:
-                            tello.move_right(20)
+                        # Fresh PID history on (re-)acquisition to avoid a derivative kick
+                        if not target_locked:
+                            pid_x.reset(offset_x)
+                            pid_y.reset(offset_y)
+                            target_locked = True
 
-                        if offset_y > tolerance:
-                            tello.move_up(20)
-                        elif offset_y < -tolerance:
-                            tello.move_down(20)
+                        lr = pid_x.update(offset_x, dt)
+                        ud = pid_y.update(offset_y, dt)
+                    else:
+                        lr, ud = 0, 0
+                        target_locked = False
 
+                    # Non-blocking velocity command, sent once per frame
+                    tello.send_rc_control(lr, 0, ud, 0)
+
+                    if DEBUG:
+                        cv2.imshow("Mask", mask)
+
+                if DEBUG:
                     cv2.imshow("Tello View", frame)
-                    cv2.imshow("Mask", mask)
 
-                    key = cv2.waitKey(1) & 0xFF
-                    if key == ord('q'):
-                        print("Exiting tracking mode.")
-                        tracking = False
-                        break
+            # Non-blocking key dispatch (plain ASCII keys only)
+            key = cv2.waitKey(1)
+            if key == -1:
+                continue
+            key &= 0xFF
 
-                # Close OpenCV windows when tracking ends
-                if cv2.getWindowProperty("Tello View", cv2.WND_PROP_VISIBLE) >= 1:
-                    cv2.destroyAllWindows()
+            if key == ord('t'):
+                if not flying:
+                    tello.takeoff()
+                    flying = True
+                    print("Drone has taken off.")
+                else:
+                    print("Drone is already flying.")
+
+            elif key == ord('s'):
+                if tracking:
+                    print("Exiting tracking mode.")
+                    tracking = False
+                    tello.send_rc_control(0, 0, 0, 0)
+                elif not flying:
+                    print("Please take off before starting tracking.")
+                else:
+                    print("Starting object tracking...")
+                    tracking = True
+                    target_locked = False
+                    prev_time = time.perf_counter()
 
-            elif cmd == "land":
+            elif key == ord('l'):
                 if flying:
+                    tracking = False
+                    tello.send_rc_control(0, 0, 0, 0)
                     tello.land()
                     flying = False
                     print("Drone landed.")
                 else:
                     print("Drone is not flying.")
 
-            elif cmd == "exit":
+            elif key == ord('q'):
                 break
 
-            else:
-                print("Unknown command. Try: takeoff, start, land, exit")
+            if not DEBUG:
+                show_status(flying, tracking)
 
     finally:
+        stop_event.set()
         if flying:
+            tello.send_rc_control(0, 0, 0, 0)
             tello.land()
         tello.streamoff()
         if cv2.getWindowProperty("Tello View", cv2.WND_PROP_VISIBLE) >= 1:
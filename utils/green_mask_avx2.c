@@ -0,0 +1,145 @@
+/*
+ * Fused BGR -> HSV -> inRange mask kernel (AVX2).
+ *
+ * Native counterpart of utils/hsv_mask.bgr_to_mask. Each block of 32 pixels
+ * is first screened with AVX2 on V and S (max/min, saturating subtract and
+ * 16-bit cross-multiplied range tests); hue is only computed, per pixel, for
+ * the candidates that pass. Built without AVX2 it falls back to scalar code.
+ *
+ * Speed depends on content: the deinterleave and the per-candidate hue step
+ * are scalar, so it only beats cvtColor + inRange when few pixels pass V/S.
+ * The tracker uses it only with TELLO_MASK_KERNEL=native.
+ *
+ * Build:
+ *     gcc -O3 -mavx2 -shared -fPIC utils/green_mask_avx2.c -o utils/libgreen_mask.so
+ *
+ * HSV values follow OpenCV's 8-bit convention: H in [0, 180), S and V in [0, 255].
+ */
+
+#include <stdint.h>
+
+#ifdef __AVX2__
+#include <immintrin.h>
+#endif
+
+/* Reciprocal table: hdiv[d] = 30 / d, so hue needs no division per pixel. */
+static double hdiv[256];
+static int hdiv_ready = 0;
+
+static void init_hdiv(void)
+{
+    hdiv[0] = 0.0;
+    for (int d = 1; d < 256; d++)
+        hdiv[d] = 30.0 / d;
+    hdiv_ready = 1;
+}
+
+static inline uint8_t pixel_in_range(int b, int g, int r,
+                                     int hL, int sL, int vL,
+                                     int hH, int sH, int vH)
+{
+    int v = b > g ? (b > r ? b : r) : (g > r ? g : r);
+    int m = b < g ? (b < r ? b : r) : (g < r ? g : r);
+    int diff = v - m;
+    int s = v > 0 ? (diff * 255 + v / 2) / v : 0;
+    double h;
+
+    if (v < vL || v > vH || s < sL || s > sH)
+        return 0;
+
+    if (diff == 0)
+        h = 0.0;
+    else if (v == r)
+        h = (g - b) * hdiv[diff];
+    else if (v == g)
+        h = 60.0 + (b - r) * hdiv[diff];
+    else
+        h = 120.0 + (r - g) * hdiv[diff];
+    if (h < 0)
+        h += 180.0;
+
+    int hi = (int)(h + 0.5);
+    if (hi >= 180)
+        hi -= 180;
+
+    return (hL <= hi && hi <= hH) ? 255 : 0;
+}
+
+void bgr_mask(const uint8_t *bgr, uint8_t *mask, int n,
+              uint8_t hL, uint8_t sL, uint8_t vL,
+              uint8_t hH, uint8_t sH, uint8_t vH)
+{
+    int i = 0;
+
+    if (!hdiv_ready)
+        init_hdiv();
+
+#ifdef __AVX2__
+    const __m256i zero = _mm256_setzero_si256();
+    const __m256i vL_vec = _mm256_set1_epi8((char)vL);
+    const __m256i vH_vec = _mm256_set1_epi8((char)vH);
+    const __m256i k255 = _mm256_set1_epi16(255);
+    const __m256i sL_vec = _mm256_set1_epi16(sL);
+    const __m256i sH1_vec = _mm256_set1_epi16(sH + 1);
+    uint8_t b[32], g[32], r[32];
+
+    for (; i + 32 <= n; i += 32) {
+        const uint8_t *p = bgr + 3 * i;
+        for (int k = 0; k < 32; k++) {
+            b[k] = p[3 * k];
+            g[k] = p[3 * k + 1];
+            r[k] = p[3 * k + 2];
+        }
+
+        __m256i bv = _mm256_loadu_si256((const __m256i *)b);
+        __m256i gv = _mm256_loadu_si256((const __m256i *)g);
+        __m256i rv = _mm256_loadu_si256((const __m256i *)r);
+
+        __m256i v = _mm256_max_epu8(_mm256_max_epu8(bv, gv), rv);
+        __m256i m = _mm256_min_epu8(_mm256_min_epu8(bv, gv), rv);
+        __m256i diff = _mm256_subs_epu8(v, m);
+
+        /* vL <= v <= vH */
+        __m256i ok = _mm256_and_si256(
+            _mm256_cmpeq_epi8(_mm256_max_epu8(v, vL_vec), v),
+            _mm256_cmpeq_epi8(_mm256_min_epu8(v, vH_vec), v));
+
+        /* sL <= s <= sH as diff*255 + v/2 >= sL*v and < (sH+1)*v, in u16 */
+        __m256i s_ok[2];
+        for (int half = 0; half < 2; half++) {
+            __m256i v16 = half ? _mm256_unpackhi_epi8(v, zero) : _mm256_unpacklo_epi8(v, zero);
+            __m256i d16 = half ? _mm256_unpackhi_epi8(diff, zero) : _mm256_unpacklo_epi8(diff, zero);
+            __m256i lhs = _mm256_add_epi16(_mm256_mullo_epi16(d16, k255), _mm256_srli_epi16(v16, 1));
+            __m256i lo = _mm256_mullo_epi16(v16, sL_vec);
+            __m256i hi = _mm256_mullo_epi16(v16, sH1_vec);
+            __m256i ge_lo = _mm256_cmpeq_epi16(_mm256_max_epu16(lhs, lo), lhs);
+            __m256i ge_hi = _mm256_cmpeq_epi16(_mm256_max_epu16(lhs, hi), lhs);
+            s_ok[half] = _mm256_andnot_si256(ge_hi, ge_lo);
+        }
+        /* packs works per 128-bit lane, restoring the unpack order */
+        __m256i s_mask = _mm256_packs_epi16(s_ok[0], s_ok[1]);
+        /* v == 0 gives s == 0, which the cross-multiplied test cannot see */
+        s_mask = _mm256_or_si256(s_mask, _mm256_cmpeq_epi8(v, zero));
+        ok = _mm256_and_si256(ok, s_mask);
+
+        uint32_t bits = (uint32_t)_mm256_movemask_epi8(ok);
+        if (bits == 0) {
+            _mm256_storeu_si256((__m256i *)(mask + i), zero);
+            continue;
+        }
+
+        /* Hue check only for candidate pixels */
+        uint8_t out[32];
+        for (int k = 0; k < 32; k++)
+            out[k] = ((bits >> k) & 1)
+                ? pixel_in_range(b[k], g[k], r[k], hL, sL, vL, hH, sH, vH)
+                : 0;
+        _mm256_storeu_si256((__m256i *)(mask + i), _mm256_loadu_si256((const __m256i *)out));
+    }
+#endif
+
+    for (; i < n; i++) {
+        const uint8_t *p = bgr + 3 * i;
+        mask[i] = pixel_in_range(p[0], p[1], p[2], hL, sL, vL, hH, sH, vH);
+    }
+}
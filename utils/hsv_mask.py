@@ -0,0 +1,210 @@
+"""
+Fused BGR -> HSV -> inRange mask kernel.
+
+Computes the binary HSV threshold mask directly from a BGR image in one
+pass, without materializing the intermediate HSV image. Uses Numba when it
+is installed and falls back to plain Python (slow, for correctness only).
+
+A native AVX2 version (green_mask_avx2.c) is used through ctypes when the
+compiled libgreen_mask.so is present next to this file.
+
+HSV values follow OpenCV's 8-bit convention: H in [0, 180), S and V in [0, 255].
+"""
+
+import ctypes
+import os
+
+import cv2
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit when Numba is not installed."""
+        return lambda f: f
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def bgr_to_mask(frame, hL, sL, vL, hH, sH, vH, out):
+    """
+    Write 255 to `out` where the BGR pixel's HSV value lies in range, else 0.
+
+    Parameters:
+        frame (np.ndarray): Input BGR image, uint8, shape (H, W, 3)
+        hL, sL, vL (int): Lower HSV threshold
+        hH, sH, vH (int): Upper HSV threshold
+        out (np.ndarray): Output mask, uint8, shape (H, W)
+    """
+    rows, cols = frame.shape[0], frame.shape[1]
+    for i in prange(rows):
+        for j in range(cols):
+            # Signed ints: under Numba, int() of a uint8 is unsigned and
+            # differences like g - b would wrap around
+            b = np.int32(frame[i, j, 0])
+            g = np.int32(frame[i, j, 1])
+            r = np.int32(frame[i, j, 2])
+
+            v = max(b, g, r)
+            diff = v - min(b, g, r)
+            s = (diff * 255 + v // 2) // v if v > 0 else 0
+
+            if diff == 0:
+                h = 0.0
+            elif v == r:
+                h = 30.0 * (g - b) / diff
+            elif v == g:
+                h = 60.0 + 30.0 * (b - r) / diff
+            else:
+                h = 120.0 + 30.0 * (r - g) / diff
+            if h < 0:
+                h += 180.0
+            hi = int(h + 0.5)
+            if hi >= 180:
+                hi -= 180
+
+            if hL <= hi <= hH and sL <= s <= sH and vL <= v <= vH:
+                out[i, j] = 255
+            else:
+                out[i, j] = 0
+
+
+# ---------------------------------------------
+# Native AVX2 kernel (optional)
+# ---------------------------------------------
+
+_LIB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "libgreen_mask.so")
+
+
+def load_native(path):
+    """
+    Load a compiled green_mask_avx2.c library and declare its signature.
+
+    Parameters:
+        path (str): Path to the shared library
+
+    Returns:
+        ctypes.CDLL: Library exposing bgr_mask
+    """
+    lib = ctypes.CDLL(path)
+    lib.bgr_mask.restype = None
+    lib.bgr_mask.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int] + [ctypes.c_uint8] * 6
+    return lib
+
+
+try:
+    _lib = load_native(_LIB_PATH)
+    HAVE_NATIVE = True
+except OSError:
+    _lib = None
+    HAVE_NATIVE = False
+
+
+def bgr_to_mask_native(frame, lower, upper, out, lib=None):
+    """
+    Native AVX2 equivalent of bgr_to_mask.
+
+    Parameters:
+        frame (np.ndarray): Input BGR image, C-contiguous uint8, shape (H, W, 3)
+        lower (np.ndarray): Lower HSV threshold
+        upper (np.ndarray): Upper HSV threshold
+        out (np.ndarray): Output mask, C-contiguous uint8, shape (H, W)
+        lib (ctypes.CDLL): Library from load_native (default: libgreen_mask.so)
+    """
+    n = frame.shape[0] * frame.shape[1]
+    (lib or _lib).bgr_mask(frame.ctypes.data, out.ctypes.data, n,
+                  *map(int, lower), *map(int, upper))
+
+
+# ---------------------------------------------
+# Parity check against OpenCV
+# ---------------------------------------------
+
+# Max fraction of the 2^24 colors allowed to differ from OpenCV
+# (rounding at hue/saturation bin edges)
+PARITY_TOLERANCE = 0.001
+
+# (lower, upper) ranges exercised by the check
+PARITY_RANGES = [
+    ((40, 70, 70), (80, 255, 255)),    # green preset
+    ((0, 120, 70), (10, 255, 255)),    # red preset
+    ((100, 150, 0), (140, 255, 255)),  # blue preset
+    ((0, 0, 0), (179, 255, 255)),      # full range
+]
+
+
+def all_bgr_colors():
+    """
+    Build a 4096x4096 BGR image containing every 24-bit color exactly once.
+
+    Returns:
+        np.ndarray: uint8 image, pixel k holds (b, g, r) = (k >> 16, k >> 8 & 0xFF, k & 0xFF)
+    """
+    idx = np.arange(1 << 24, dtype=np.uint32).reshape(4096, 4096)
+    colors = np.empty((4096, 4096, 3), np.uint8)
+    colors[..., 0] = idx >> 16
+    colors[..., 1] = (idx >> 8) & 0xFF
+    colors[..., 2] = idx & 0xFF
+    return colors
+
+
+def check_parity(lower, upper, lib_paths=()):
+    """
+    Compare the compiled kernels with cv2.cvtColor + cv2.inRange on all colors.
+
+    Only kernels that are actually available (jitted Numba, native library)
+    are checked; the un-jitted Python fallback is too slow for 2^24 pixels.
+    Extra native builds (e.g. a scalar build without -mavx2) can be passed
+    in lib_paths.
+
+    Parameters:
+        lower (tuple): Lower HSV threshold
+        upper (tuple): Upper HSV threshold
+        lib_paths (iterable): Additional native library paths to check
+
+    Returns:
+        dict: kernel name -> number of colors whose mask value differs
+    """
+    colors = all_bgr_colors()
+    lower = np.asarray(lower, np.uint8)
+    upper = np.asarray(upper, np.uint8)
+    ref = cv2.inRange(cv2.cvtColor(colors, cv2.COLOR_BGR2HSV), lower, upper)
+    out = np.empty(ref.shape, np.uint8)
+
+    mismatches = {}
+    if HAVE_NUMBA:
+        bgr_to_mask(colors, *map(int, lower), *map(int, upper), out)
+        mismatches["numba"] = int(np.count_nonzero(out != ref))
+    if HAVE_NATIVE:
+        bgr_to_mask_native(colors, lower, upper, out)
+        mismatches["native"] = int(np.count_nonzero(out != ref))
+    for path in lib_paths:
+        bgr_to_mask_native(colors, lower, upper, out, lib=load_native(path))
+        mismatches[path] = int(np.count_nonzero(out != ref))
+    return mismatches
+
+
+# ---------------------------------------------
+# Entry Point: python -m utils.hsv_mask [extra_lib.so ...]
+# ---------------------------------------------
+
+if __name__ == "__main__":
+    import sys
+
+    lib_paths = sys.argv[1:]
+    if not (HAVE_NUMBA or HAVE_NATIVE or lib_paths):
+        print("Neither Numba nor libgreen_mask.so is available; nothing to check.")
+        sys.exit(0)
+
+    limit = int(PARITY_TOLERANCE * (1 << 24))
+    failed = False
+    for lower, upper in PARITY_RANGES:
+        for name, count in check_parity(lower, upper, lib_paths).items():
+            ok = count <= limit
+            failed |= not ok
+            print("%-6s %s-%s: %d mismatches %s" % (name, lower, upper, count, "ok" if ok else "FAIL"))
+    sys.exit(1 if failed else 0)
@@ -1,14 +1,56 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+OUTPUT_MAX = 100
+
+# State layout: [integral, prev_error, kp, ki, kd, i_max, alpha, prev_d]
+INTEGRAL, PREV_ERROR, KP, KI, KD, I_MAX, ALPHA, PREV_D = range(8)
+
+
+@njit(cache=True, fastmath=True)
+def pid_update(state, error, dt):
+    # Integral with anti-windup clamp
+    integral = state[INTEGRAL] + error * dt
+    if integral > state[I_MAX]:
+        integral = state[I_MAX]
+    elif integral < -state[I_MAX]:
+        integral = -state[I_MAX]
+    state[INTEGRAL] = integral
+
+    # Low-pass filtered derivative
+    raw_d = (error - state[PREV_ERROR]) / dt if dt > 0 else 0.0
+    d = state[ALPHA] * raw_d + (1.0 - state[ALPHA]) * state[PREV_D]
+    state[PREV_D] = d
+
+    out = state[KP] * error + state[KI] * integral + state[KD] * d
+    state[PREV_ERROR] = error
+    if out > OUTPUT_MAX:
+        out = OUTPUT_MAX
+    elif out < -OUTPUT_MAX:
+        out = -OUTPUT_MAX
+    return int(out)
+
+
 class PID:
-    def __init__(self, kp, ki, kd):
-        self.kp = kp
-        self.ki = ki
-        self.kd = kd
-        self.prev_error = 0
-        self.integral = 0
+    def __init__(self, kp, ki, kd, i_max=None, alpha=0.5):
+        # By default the integral alone may just saturate the output. With
+        # ki == 0 the integral is unused, but the bound must stay finite:
+        # pid_update is compiled with fastmath, which assumes no infinities
+        if i_max is None:
+            i_max = OUTPUT_MAX / ki if ki > 0 else float(OUTPUT_MAX)
+        self.state = np.array([0.0, 0.0, kp, ki, kd, i_max, alpha, 0.0], dtype=np.float64)
+
+    def reset(self, error=0.0):
+        # Clear integral/derivative history; prev_error = error so the next
+        # update sees no derivative jump
+        self.state[INTEGRAL] = 0.0
+        self.state[PREV_ERROR] = error
+        self.state[PREV_D] = 0.0
 
     def update(self, error, dt):
-        self.integral += error * dt
-        derivative = (error - self.prev_error) / dt if dt > 0 else 0
-        output = self.kp * error + self.ki * self.integral + self.kd * derivative
-        self.prev_error = error
-        return int(max(min(output, 100), -100))
+        return pid_update(self.state, float(error), float(dt))